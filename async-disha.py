@@ -1,40 +1,208 @@
-from openai import AsyncOpenAI
-import json
-from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError
+import httpx
+import asyncio
+import orjson
+import logging
+import os
+import sys
+from contextlib import aclosing, asynccontextmanager
+from typing import Annotated, Dict, Any, List, Set, AsyncIterator, Optional, Tuple
+from cachetools import TTLCache
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import msgspec
+import numpy as np
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from mock_data_loader import MockDataLoader
+from semantic_cache import SemanticCache
+from session_store import SessionStore, RedisSessionStore
 
-class UserInput(BaseModel):
+logger = logging.getLogger(__name__)
+
+_SYSTEM_PROMPT = """You are a banking assistant that helps users check their account information. If an user speaks in Bengali, you reply in Bengali. Always reply in Bengali, but never use emojis. And Be concise and succinct.
+Follow a strict flow:
+1. Ask for account number first
+2. Then ask for PIN
+3. Then provide detailed account information including:
+   - Current balance with currency symbol
+   - Account type and its features
+   - Account status
+   - Last transaction date
+   - Account holder name
+
+Be professional but friendly. Use the provided functions to validate all information.
+If an account is frozen, warn the user appropriately."""
+
+# Static tool schema, built once and shared by every request
+_TOOLS_SCHEMA = [
+    {
+        "type": "function",
+        "function": {
+            "name": "validate_account_number",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "account_number": {"type": "string"}
+                },
+                "required": ["account_number"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "validate_pin",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "account_number": {"type": "string"},
+                    "pin": {"type": "string"}
+                },
+                "required": ["account_number", "pin"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_account_balance",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "account_number": {"type": "string"},
+                    "pin": {"type": "string"}
+                },
+                "required": ["account_number", "pin"]
+            }
+        }
+    }
+]
+
+# Prompts are a static prefix (tools + system prompt), the rolling summary, then the
+# unsummarized turns, appended only. Every _SUMMARY_INTERVAL turns all but the last
+# _RECENT_TURNS turn blocks (user message through final reply, tool traffic included)
+# fold into the summary, so the cacheable prefix only changes at those points.
+_RECENT_TURNS = 4
+_SUMMARY_INTERVAL = 10
+
+_SUMMARY_PROMPT = """Summarize this banking assistant conversation in a few short sentences.
+Keep the account number under discussion, which verification steps have succeeded, and anything the user asked for that is still open.
+Never include PINs."""
+
+# Reply for a successful balance lookup on an active account, rendered locally so
+# the common path needs no second completion
+_BALANCE_TEMPLATE = """অ্যাকাউন্ট হোল্ডার: {account_holder}
+অ্যাকাউন্টের ধরন: {account_type}
+বর্তমান ব্যালেন্স: {formatted_balance}
+অ্যাকাউন্টের অবস্থা: সক্রিয়
+সর্বশেষ লেনদেন: {last_transaction_date}"""
+
+_FEATURE_LABELS = {
+    "daily_withdrawal_limit": "দৈনিক উত্তোলন সীমা",
+    "minimum_balance": "ন্যূনতম ব্যালেন্স",
+    "monthly_fee": "মাসিক ফি",
+    "interest_rate": "সুদের হার",
+    "term_length": "মেয়াদ"
+}
+
+def render_balance_reply(function_names: List[str], function_responses: List[Dict[str, Any]]) -> Optional[str]:
+    """Render the balance reply locally, or None when the turn needs the model"""
+    data = None
+    for function_name, function_response in zip(function_names, function_responses):
+        if function_name == "get_account_balance" and function_response.get("status") == "success":
+            if data is not None:
+                return None  # Several accounts in one turn; let the model present them together
+            data = function_response["data"]
+        elif not function_response.get("valid"):
+            return None  # Any failed check gets a model-written explanation
+
+    # Frozen or otherwise unusual accounts need a tailored warning
+    if data is None or data["account_status"] != "active":
+        return None
+
+    lines = [_BALANCE_TEMPLATE.format(
+        last_transaction_date=data["last_transaction"][:10],
+        **data
+    )]
+    for feature, label in _FEATURE_LABELS.items():
+        value = data["account_features"].get(feature)
+        if value is None:
+            continue
+        if feature == "interest_rate":
+            value = f"{value}%"
+        elif isinstance(value, (int, float)):
+            value = f"{value:,} {data['currency']}"
+        lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+class UserInput(msgspec.Struct):
+    message: str
+
+class BatchItem(msgspec.Struct):
+    session_id: str
     message: str
 
+# Each submitted turn's prompt is stored with the batch, so cap how many one batch can hold
+_MAX_BATCH_REQUESTS = 1_000
+
+class BatchInput(msgspec.Struct):
+    requests: Annotated[List[BatchItem], msgspec.Meta(min_length=1, max_length=_MAX_BATCH_REQUESTS)]
+
+# Request bodies are decoded straight into structs; build the decoders once
+_USER_INPUT_DECODER = msgspec.json.Decoder(UserInput)
+_BATCH_INPUT_DECODER = msgspec.json.Decoder(BatchInput)
+
+async def decode_body(request: Request, decoder: msgspec.json.Decoder) -> Any:
+    """Decode a JSON request body, rejecting malformed input with a 422"""
+    try:
+        return decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# Back off and retry OpenAI calls that hit the rate limit
+_retry_rate_limits = retry(
+    retry=retry_if_exception_type(RateLimitError),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(6),
+    reraise=True
+)
+
 class AsyncBankingChatbot:
     def __init__(self):
-        self.client = AsyncOpenAI()
+        # One pooled HTTP/2 client for the process lifetime; requests multiplex over warm connections
+        self.client = AsyncOpenAI(
+            http_client=DefaultAsyncHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+            )
+        )
         self.mock_data = MockDataLoader()
+        self.response_cache = SemanticCache(self.client)
+        # Cap in-flight OpenAI requests so bursts stay under the provider's rate limits
+        self._openai_semaphore = asyncio.Semaphore(50)
+        
+        # Tool selection needs the stronger model; synthesizing a reply from tool
+        # results and summarizing history are simple enough for the small one
+        self.model_primary = "gpt-4o"
+        self.model_synth = "gpt-4o-mini"
+        self.model_summary = "gpt-4o-mini"
         
-        # Store conversations by session ID
-        self.conversations: Dict[str, List[Dict[str, str]]] = {}
+        # Conversation history and per-session state (summary bookkeeping), evicted when idle.
+        # Set REDIS_URL to share sessions between workers; otherwise they live in this process.
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            self.sessions = RedisSessionStore(redis_url, ttl=1800)
+        else:
+            self.sessions = SessionStore(maxsize=10_000, ttl=1800)
+        # Speculative replies to predicted next messages, by session ID
+        self.speculations: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+        # Keep references to background summary tasks so they aren't garbage collected
+        self._background_tasks: Set[asyncio.Task] = set()
+        # Sessions with a summary refresh in flight in this process
+        self._summarizing: Set[str] = set()
 
     def get_initial_conversation(self) -> List[Dict[str, str]]:
-        return [
-            {
-                "role": "system",
-                "content": """You are a banking assistant that helps users check their account information. If an user speaks in Bengali, you reply in Bengali. Always reply in Bengali, but never use emojis. And Be concise and succinct.
-                Follow a strict flow:
-                1. Ask for account number first
-                2. Then ask for PIN
-                3. Then provide detailed account information including:
-                   - Current balance with currency symbol
-                   - Account type and its features
-                   - Account status
-                   - Last transaction date
-                   - Account holder name
-                
-                Be professional but friendly. Use the provided functions to validate all information.
-                If an account is frozen, warn the user appropriately."""
-            }
-        ]
+        return [{"role": "system", "content": _SYSTEM_PROMPT}]
 
     def validate_account_number(self, account_number: str) -> Dict[str, Any]:
         account = self.mock_data.get_account(account_number)
@@ -83,132 +251,597 @@ class AsyncBankingChatbot:
             }
         }
 
-    async def process_message(self, session_id: str, user_input: str) -> str:
-        # Initialize conversation history if it doesn't exist
-        if session_id not in self.conversations:
-            self.conversations[session_id] = self.get_initial_conversation()
-        
-        # Add user message to history
-        self.conversations[session_id].append({"role": "user", "content": user_input})
-
-        # Get completion from OpenAI
-        response = await self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=self.conversations[session_id],
-            tools=[
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "validate_account_number",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "account_number": {"type": "string"}
-                            },
-                            "required": ["account_number"]
-                        }
-                    }
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "validate_pin",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "account_number": {"type": "string"},
-                                "pin": {"type": "string"}
-                            },
-                            "required": ["account_number", "pin"]
-                        }
-                    }
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_account_balance",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "account_number": {"type": "string"},
-                                "pin": {"type": "string"}
-                            },
-                            "required": ["account_number", "pin"]
-                        }
-                    }
-                }
-            ],
-            tool_choice="auto"
+    async def dispatch_tool_call(self, tool_call) -> Dict[str, Any]:
+        """Run a single tool call and return the function's result"""
+        function_name = tool_call["function"]["name"]
+        function_args = orjson.loads(tool_call["function"]["arguments"])
+
+        # Call the appropriate function off the event loop
+        if function_name == "validate_account_number":
+            function_response = await asyncio.to_thread(
+                self.validate_account_number,
+                function_args["account_number"]
+            )
+        elif function_name == "validate_pin":
+            function_response = await asyncio.to_thread(
+                self.validate_pin,
+                function_args["account_number"],
+                function_args["pin"]
+            )
+        elif function_name == "get_account_balance":
+            function_response = await asyncio.to_thread(
+                self.get_account_balance,
+                function_args["account_number"],
+                function_args["pin"]
+            )
+        else:
+            function_response = {"status": "error", "message": f"Unknown function: {function_name}"}
+
+        return function_response
+
+    async def build_messages(self, session_id: str, state: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Build the prompt: system prompt, rolling summary, then unsummarized history"""
+        messages = self.get_initial_conversation()
+        if state.get("summary"):
+            messages.append({
+                "role": "system",
+                "content": f"Conversation summary so far:\n{state['summary']}"
+            })
+        messages.extend(await self.sessions.get_messages(session_id, state.get("summarized_upto", 0)))
+        return messages
+
+    async def summarize_history(self, session_id: str) -> None:
+        """Fold every turn block before the most recent ones into the rolling summary"""
+        # Snapshot under the lock, then summarize without it so turns aren't held up by the call
+        async with self.sessions.lock(session_id):
+            state = await self.sessions.get_state(session_id)
+            turns_since_summary = state.get("turns_since_summary", 0)
+            if turns_since_summary < _SUMMARY_INTERVAL:
+                return  # Already refreshed by an earlier task
+            summarized_upto = state.get("summarized_upto", 0)
+            unsummarized = await self.sessions.get_messages(session_id, summarized_upto)
+
+            # Each turn block starts at a user message, so tool calls stay paired with their results
+            turn_starts = [index for index, message in enumerate(unsummarized) if message["role"] == "user"]
+            if len(turn_starts) <= _RECENT_TURNS:
+                return
+            cut = turn_starts[-_RECENT_TURNS]
+
+        transcript = []
+        for message in unsummarized[:cut]:
+            if message.get("tool_calls"):
+                names = ", ".join(tool_call["function"]["name"] for tool_call in message["tool_calls"])
+                transcript.append(f"assistant called: {names}")
+            elif message.get("content"):
+                transcript.append(f"{message['role']}: {message['content']}")
+        previous = f"Previous summary:\n{state['summary']}\n\n" if state.get("summary") else ""
+
+        response = await self.create_completion(
+            model=self.model_summary,
+            messages=[
+                {"role": "system", "content": _SUMMARY_PROMPT},
+                {"role": "user", "content": previous + "\n".join(transcript)}
+            ]
+        )
+
+        async with self.sessions.lock(session_id):
+            current = await self.sessions.get_state(session_id)
+            # History only grows, so the summary still applies unless another refresh landed
+            # first or the session was deleted or expired in the meantime
+            if current.get("summarized_upto", 0) != summarized_upto:
+                return
+            if await self.sessions.count_messages(session_id) < summarized_upto + cut:
+                return
+            await self.sessions.update_state(
+                session_id,
+                summary=response.choices[0].message.content,
+                summarized_upto=summarized_upto + cut,
+                # Turns committed while the summary was written still count towards the next one
+                turns_since_summary=current.get("turns_since_summary", 0) - turns_since_summary
+            )
+
+    def schedule_summary(self, session_id: str) -> None:
+        """Refresh the summary in the background; it only locks the session to read and write, so no reply waits on it"""
+        if session_id in self._summarizing:
+            return  # Turns committed meanwhile are picked up by the next refresh
+
+        async def run():
+            try:
+                await self.summarize_history(session_id)
+            except Exception:
+                logger.exception("Failed to summarize session %s", session_id)
+            finally:
+                self._summarizing.discard(session_id)
+
+        self._summarizing.add(session_id)
+
+        task = asyncio.create_task(run())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    @_retry_rate_limits
+    async def create_completion(self, **kwargs: Any) -> Any:
+        """Create a chat completion, limiting concurrency and backing off on rate limits"""
+        # A stream is still running after this returns, so stream_completion holds its slot instead
+        if kwargs.get("stream"):
+            return await self.client.chat.completions.create(**kwargs)
+        async with self._openai_semaphore:
+            response = await self.client.chat.completions.create(**kwargs)
+        if response.usage:
+            await self.record_usage(kwargs["model"], response.usage.model_dump())
+        return response
+
+    @_retry_rate_limits
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed text for the semantic cache, limiting concurrency and backing off on rate limits"""
+        async with self._openai_semaphore:
+            return await self.response_cache.embed(text)
+
+    async def record_usage(self, model: str, usage: Dict[str, Any]) -> None:
+        """Add a completion's token counts (API usage object) to the running totals and log them"""
+        prompt_tokens = usage["prompt_tokens"]
+        completion_tokens = usage["completion_tokens"]
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        # Kept in the session store, so with Redis the totals cover every worker, not just this one
+        await self.sessions.add_usage(model, {
+            "requests": 1,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens
+        })
+        logger.info(
+            "%s usage: prompt=%d (cached=%d) completion=%d",
+            model, prompt_tokens, cached_tokens, completion_tokens
         )
 
-        assistant_message = response.choices[0].message
+    async def stream_completion(
+        self,
+        tool_calls: Optional[List[Dict[str, Any]]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """Stream a chat completion, yielding text deltas as they arrive.
+
+        Tool calls arrive in fragments; pass a list as tool_calls to collect them reassembled.
+        """
+        partial_calls: Dict[int, Dict[str, Any]] = {}
+        # Hold the OpenAI slot until the last chunk is read, not just until the response starts
+        async with self._openai_semaphore:
+            stream = await self.create_completion(
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            async for chunk in stream:
+                # Usage arrives on a final chunk with no choices
+                if chunk.usage:
+                    await self.record_usage(kwargs["model"], chunk.usage.model_dump())
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    yield delta.content
+                for tool_call_delta in delta.tool_calls or ():
+                    partial = partial_calls.setdefault(tool_call_delta.index, {
+                        "id": None,
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""}
+                    })
+                    if tool_call_delta.id:
+                        partial["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        partial["function"]["name"] += tool_call_delta.function.name or ""
+                        partial["function"]["arguments"] += tool_call_delta.function.arguments or ""
+
+        if tool_calls is not None:
+            tool_calls.extend(partial_calls[index] for index in sorted(partial_calls))
+
+    async def prefetch(self, session_id: str, prediction: str) -> bool:
+        """Run a predicted next turn ahead of time without committing it to history"""
+        if await self.sessions.is_locked(session_id):
+            return False  # A real turn is in flight; its history would make this speculation stale
+
+        # Snapshot the session under the lock, then speculate without it so a mispredicted
+        # prefetch never delays the real message; claim_speculation drops stale results
+        async with self.sessions.lock(session_id):
+            state = await self.sessions.get_state(session_id)
+            message_count = await self.sessions.count_messages(session_id)
+            messages = await self.build_messages(session_id, state)
+
+        turn_messages: List[Dict[str, Any]] = []
+        async for _ in self._process_message(messages, prediction, turn_messages):
+            pass
+
+        # Tool results depend on the exact input (account numbers, PINs), so only plain replies are kept
+        if len(turn_messages) != 2:
+            return False
+
+        embedding = None
+        if not any(ch.isdigit() for ch in prediction):
+            embedding = await self.embed(prediction)
+        self.speculations[session_id] = {
+            "message_count": message_count,
+            "prediction": prediction,
+            "embedding": embedding,
+            "response": turn_messages[-1]["content"]
+        }
+        return True
+
+    async def claim_speculation(
+        self,
+        session_id: str,
+        user_input: str
+    ) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return the prefetched reply if it was made for this point in the session and a matching message.
+
+        Also returns the message's embedding if one was computed, so the turn can reuse it.
+        """
+        speculation = self.speculations.pop(session_id, None)
+        if speculation is None:
+            return None, None
+        if speculation["message_count"] != await self.sessions.count_messages(session_id):
+            return None, None
+
+        if user_input.strip().casefold() == speculation["prediction"].strip().casefold():
+            return speculation["response"], None
+        if speculation["embedding"] is None or any(ch.isdigit() for ch in user_input):
+            return None, None
+
+        embedding = await self.embed(user_input)
+        if float(embedding @ speculation["embedding"]) < self.response_cache.threshold:
+            return None, embedding
+        return speculation["response"], embedding
+
+    async def commit_turn(self, session_id: str, state: Dict[str, Any], turn_messages: List[Dict[str, Any]]) -> None:
+        """Persist a finished turn and schedule a summary refresh when one is due"""
+        await self.sessions.append_messages(session_id, turn_messages)
+        turns_since_summary = state.get("turns_since_summary", 0) + 1
+        await self.sessions.update_state(session_id, turns_since_summary=turns_since_summary)
+        if turns_since_summary >= _SUMMARY_INTERVAL:
+            self.schedule_summary(session_id)
+
+    async def process_message(self, session_id: str, user_input: str) -> AsyncIterator[str]:
+        """Run one turn, yielding the assistant's reply as it streams"""
+        async with self.sessions.lock(session_id):
+            state = await self.sessions.get_state(session_id)
+            turn_messages: List[Dict[str, Any]] = []
+            speculative_response, embedding = await self.claim_speculation(session_id, user_input)
+            if speculative_response is not None:
+                turn_messages.append({"role": "user", "content": user_input})
+                turn_messages.append({"role": "assistant", "content": speculative_response})
+                yield speculative_response
+            else:
+                messages = await self.build_messages(session_id, state)
+                # Closed explicitly so an abandoned stream gives back its OpenAI slot right away
+                async with aclosing(self._process_message(messages, user_input, turn_messages, embedding)) as deltas:
+                    async for delta in deltas:
+                        yield delta
+
+            await self.commit_turn(session_id, state, turn_messages)
+
+    async def _process_message(
+        self,
+        messages: List[Dict[str, Any]],
+        user_input: str,
+        turn_messages: List[Dict[str, Any]],
+        embedding: Optional[np.ndarray] = None
+    ) -> AsyncIterator[str]:
+        """Run one turn, appending the messages it adds to turn_messages.
+
+        Pass the user input's embedding if it's already been computed.
+        """
+        # Only the system prompt so far: nothing in the reply can depend on this user's history
+        opening_turn = len(messages) == 1
+        turn_messages.append({"role": "user", "content": user_input})
+        messages.append(turn_messages[-1])
+
+        # Serve a session's opening turn from the semantic cache; later replies can refer to
+        # the user's account and must never be shared. Anything with digits may be an
+        # account number or PIN, so it always goes to the model.
+        cache_embedding = None
+        if opening_turn and not any(ch.isdigit() for ch in user_input):
+            cache_embedding = embedding if embedding is not None else await self.embed(user_input)
+            cached_response = self.response_cache.lookup(cache_embedding)
+            if cached_response is not None:
+                turn_messages.append({"role": "assistant", "content": cached_response})
+                yield cached_response
+                return
+
+        # Stream the completion from OpenAI, collecting any function calls
+        tool_calls: List[Dict[str, Any]] = []
+        content_parts: List[str] = []
+        async with aclosing(self.stream_completion(
+            tool_calls,
+            model=self.model_primary,
+            messages=messages,
+            tools=_TOOLS_SCHEMA,
+            tool_choice="auto"
+        )) as deltas:
+            async for delta in deltas:
+                content_parts.append(delta)
+                yield delta
         
         # Handle any function calls
-        if assistant_message.tool_calls:
-            # Process each function call
-            for tool_call in assistant_message.tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                # Call the appropriate function
-                if function_name == "validate_account_number":
-                    function_response = self.validate_account_number(function_args["account_number"])
-                elif function_name == "validate_pin":
-                    function_response = self.validate_pin(
-                        function_args["account_number"],
-                        function_args["pin"]
-                    )
-                elif function_name == "get_account_balance":
-                    function_response = self.get_account_balance(
-                        function_args["account_number"],
-                        function_args["pin"]
-                    )
-                
-                # Append the function call and result to the conversation
-                self.conversations[session_id].append({
-                    "role": "assistant",
-                    "content": None,
-                    "tool_calls": [tool_call]
-                })
-                self.conversations[session_id].append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": json.dumps(function_response)
-                })
-            
-            # Get the final response after function calls
-            second_response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=self.conversations[session_id]
-            )
-            assistant_response = second_response.choices[0].message.content
-        else:
-            assistant_response = assistant_message.content
+        if tool_calls:
+            async with aclosing(self.respond_to_tool_calls(
+                messages, turn_messages, "".join(content_parts) or None, tool_calls
+            )) as deltas:
+                async for delta in deltas:
+                    yield delta
+            return
+
+        assistant_response = "".join(content_parts)
+        # Only plain replies are cached; tool-using turns depend on session data
+        if cache_embedding is not None and assistant_response:
+            self.response_cache.store(cache_embedding, assistant_response)
 
         # Add assistant's response to history
-        self.conversations[session_id].append({"role": "assistant", "content": assistant_response})
+        turn_messages.append({"role": "assistant", "content": assistant_response})
+
+    async def respond_to_tool_calls(
+        self,
+        messages: List[Dict[str, Any]],
+        turn_messages: List[Dict[str, Any]],
+        content: Optional[str],
+        tool_calls: List[Dict[str, Any]]
+    ) -> AsyncIterator[str]:
+        """Run the model's tool calls and yield the reply built from their results.
+
+        The tool traffic and the reply are appended to turn_messages and messages.
+        """
+        # Record the assistant turn once with every tool call it requested
+        tool_messages: List[Dict[str, Any]] = [{
+            "role": "assistant",
+            "content": content,
+            "tool_calls": tool_calls
+        }]
+
+        # Run all function calls concurrently; results come back in call order
+        function_responses = await asyncio.gather(
+            *(self.dispatch_tool_call(tool_call) for tool_call in tool_calls)
+        )
+        for tool_call, function_response in zip(tool_calls, function_responses):
+            tool_messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "content": orjson.dumps(function_response).decode()
+            })
+        turn_messages.extend(tool_messages)
+        messages.extend(tool_messages)
         
-        return assistant_response
+        # A plain successful balance lookup is answered from the template;
+        # everything else streams a final response from the model
+        assistant_response = render_balance_reply(
+            [tool_call["function"]["name"] for tool_call in tool_calls],
+            function_responses
+        )
+        if assistant_response is not None:
+            yield assistant_response
+        else:
+            content_parts = []
+            async with aclosing(self.stream_completion(model=self.model_synth, messages=messages)) as deltas:
+                async for delta in deltas:
+                    content_parts.append(delta)
+                    yield delta
+            assistant_response = "".join(content_parts)
+
+        turn_messages.append({"role": "assistant", "content": assistant_response})
+
+    async def submit_batch(self, requests: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """Submit (session_id, message) turns to the OpenAI Batch API at half the realtime price"""
+        items = []
+        lines = []
+        for index, (session_id, message) in enumerate(requests):
+            state = await self.sessions.get_state(session_id)
+            message_count = await self.sessions.count_messages(session_id)
+            messages = await self.build_messages(session_id, state)
+            messages.append({"role": "user", "content": message})
+            items.append({
+                "custom_id": str(index),
+                "session_id": session_id,
+                "message": message,
+                "messages": messages,
+                "message_count": message_count
+            })
+            lines.append(orjson.dumps({
+                "custom_id": str(index),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.model_primary,
+                    "messages": messages,
+                    "tools": _TOOLS_SCHEMA,
+                    "tool_choice": "auto"
+                }
+            }))
+
+        input_file = await self.client.files.create(
+            file=("chat_batch.jsonl", b"\n".join(lines)),
+            purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        # Kept in the session store so any worker can collect the batch, even after a restart
+        await self.sessions.put_batch(batch.id, items)
+        return {"batch_id": batch.id, "status": batch.status}
+
+    async def collect_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Check a submitted batch; once it completes, finish each turn and return the replies"""
+        items = await self.sessions.get_batch(batch_id)
+        if items is None:
+            return None
+
+        results = await self.sessions.get_batch_results(batch_id)
+        if len(results) < len(items):
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status != "completed":
+                return {"batch_id": batch_id, "status": batch.status}
+
+            # Successful requests land in the output file and failed ones in the error file;
+            # either may be missing when every request went the same way
+            records = {}
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                content = await self.client.files.content(file_id)
+                for line in content.content.splitlines():
+                    record = orjson.loads(line)
+                    records[record["custom_id"]] = record
+
+            # Each turn's result is recorded as it's committed, so a retry after a failure
+            # (or a concurrent collect from another worker) skips turns already finished
+            for item in items:
+                if item["custom_id"] not in results:
+                    results[item["custom_id"]] = await self.finish_batched_turn(
+                        batch_id, item, records.get(item["custom_id"])
+                    )
+
+        return {
+            "batch_id": batch_id,
+            "status": "completed",
+            "results": [results[item["custom_id"]] for item in items]
+        }
+
+    async def finish_batched_turn(
+        self,
+        batch_id: str,
+        item: Dict[str, Any],
+        record: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Complete a turn from a batched first completion, commit it to the session and record the result"""
+        session_id = item["session_id"]
+        async with self.sessions.lock(session_id):
+            results = await self.sessions.get_batch_results(batch_id)
+            if item["custom_id"] in results:
+                return results[item["custom_id"]]
+
+            response = record.get("response") if record else None
+            if response is None or record.get("error") or response["status_code"] != 200:
+                error = record and (record.get("error") or (response or {}).get("body", {}).get("error"))
+                result = {"session_id": session_id, "error": error or "No response"}
+            elif await self.sessions.count_messages(session_id) != item["message_count"]:
+                # The reply was written for the history at submit time; appending it now would
+                # misplace it (or resurrect an expired session), so the turn is dropped instead
+                result = {"session_id": session_id, "error": "Session changed since the batch was submitted"}
+            else:
+                body = response["body"]
+                if body.get("usage"):
+                    await self.record_usage(f"batch:{body['model']}", body["usage"])
+                assistant_message = body["choices"][0]["message"]
+
+                state = await self.sessions.get_state(session_id)
+                turn_messages: List[Dict[str, Any]] = [{"role": "user", "content": item["message"]}]
+                tool_calls = assistant_message.get("tool_calls")
+                if tool_calls:
+                    async for _ in self.respond_to_tool_calls(
+                        item["messages"], turn_messages, assistant_message.get("content"), tool_calls
+                    ):
+                        pass
+                else:
+                    turn_messages.append({"role": "assistant", "content": assistant_message.get("content") or ""})
+
+                await self.commit_turn(session_id, state, turn_messages)
+                result = {"session_id": session_id, "response": turn_messages[-1]["content"]}
+
+            await self.sessions.put_batch_result(batch_id, item["custom_id"], result)
+            return result
 
 # Create FastAPI app and chatbot instance
-app = FastAPI()
 chatbot = AsyncBankingChatbot()
 
-@app.post("/chat/{session_id}")
-async def chat_endpoint(session_id: str, user_input: UserInput):
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Close pooled connections on shutdown
+    await chatbot.client.close()
+    await chatbot.sessions.close()
+
+app = FastAPI(lifespan=lifespan)
+
+def sse_event(payload: Any) -> str:
+    """Format a payload as a server-sent event"""
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+async def stream_reply(session_id: str, message: str) -> AsyncIterator[str]:
+    """Relay a turn's deltas as server-sent events, ending with [DONE]"""
+    try:
+        async with aclosing(chatbot.process_message(session_id, message)) as deltas:
+            async for delta in deltas:
+                yield sse_event({"delta": delta})
+    except Exception as e:
+        # Headers are already sent, so errors travel in-band
+        logger.exception("Chat turn failed for session %s", session_id)
+        yield sse_event({"error": str(e)})
+    yield "data: [DONE]\n\n"
+
+# Registered before /chat/{session_id} so "batch" isn't taken as a session ID
+@app.post("/chat/batch")
+async def submit_batch(request: Request):
+    batch_input = await decode_body(request, _BATCH_INPUT_DECODER)
+    try:
+        return await chatbot.submit_batch(
+            [(item.session_id, item.message) for item in batch_input.requests]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/chat/batch/{batch_id}")
+async def get_batch(batch_id: str):
     try:
-        response = await chatbot.process_message(session_id, user_input.message)
-        return {"response": response}
+        result = await chatbot.collect_batch(batch_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return result
+
+@app.post("/chat/{session_id}")
+async def chat_endpoint(
+    session_id: str,
+    request: Request,
+    x_speculative: Optional[str] = Header(None)
+):
+    user_input = await decode_body(request, _USER_INPUT_DECODER)
+
+    # Speculative requests warm a reply for a predicted message; nothing is streamed back
+    if x_speculative == "1":
+        try:
+            prefetched = await chatbot.prefetch(session_id, user_input.message)
+        except Exception:
+            logger.exception("Speculative turn failed for session %s", session_id)
+            prefetched = False
+        return {"prefetched": prefetched}
+
+    return StreamingResponse(
+        stream_reply(session_id, user_input.message),
+        media_type="text/event-stream"
+    )
+
+@app.get("/metrics/tokens")
+async def token_metrics():
+    # Summed across workers with Redis; the in-process store only counts this worker
+    return await chatbot.sessions.get_usage()
 
 @app.delete("/chat/{session_id}")
 async def end_session(session_id: str):
-    if session_id in chatbot.conversations:
-        del chatbot.conversations[session_id]
+    await chatbot.sessions.delete(session_id)
+    chatbot.speculations.pop(session_id, None)
     return {"message": "Session ended successfully"}
 
-# Run the server
+# Run the server. For containers, prefer:
+#   gunicorn -k uvicorn.workers.UvicornWorker --workers N async-disha:app
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Sessions only survive across workers in Redis, so default to one worker without it
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() if os.getenv("REDIS_URL") else 1))
+    uvicorn.run(
+        "async-disha:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop doesn't support Windows
+        http="httptools",
+        workers=workers,
+        log_level="warning"
+    )
@@ -1,14 +1,80 @@
 import asyncio
 import aiohttp
+import json
+import threading
 import uuid
-from typing import Optional
+from typing import AsyncIterator, Optional
 import sys
 import os
 
+# Most sessions open by asking for a balance and close with a thank-you once it's shown
+_OPENING_PREDICTION = "আমি আমার অ্যাকাউন্টের ব্যালেন্স জানতে চাই"
+_CLOSING_PREDICTION = "ধন্যবাদ"
+_BALANCE_MARKER = "বর্তমান ব্যালেন্স"
+
+# Clear the screen and move the cursor home
+_CLEAR_SCREEN = "\x1b[2J\x1b[H"
+
+def enable_windows_ansi():
+    """Turn on VT escape processing for the Windows console (no-op elsewhere)"""
+    if os.name != 'nt':
+        return
+    import ctypes
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+    mode = ctypes.c_uint32()
+    if kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+        kernel32.SetConsoleMode(handle, mode.value | 0x0004)  # ENABLE_VIRTUAL_TERMINAL_PROCESSING
+
+async def read_input(prompt: str) -> str:
+    """Read a line from stdin without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(line: Optional[str], error: Optional[BaseException]):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(line)
+
+    def reader():
+        try:
+            line, error = input(prompt), None
+        except BaseException as e:
+            line, error = None, e
+        try:
+            loop.call_soon_threadsafe(resolve, line, error)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    # A daemon thread rather than asyncio.to_thread: the default executor is joined
+    # at shutdown, so Ctrl+C would hang until Enter while input() is still blocked
+    threading.Thread(target=reader, daemon=True).start()
+    return await future
+
 class BankingBotClient:
     def __init__(self, server_url: str = "http://localhost:8000"):
         self.server_url = server_url
         self.session_id: Optional[str] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+        enable_windows_ansi()
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """Shared HTTP session, reused across turns to keep connections alive"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60)
+            )
+        return self._http
+
+    async def aclose(self):
+        """Close the shared HTTP session"""
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        self._http = None
         
     async def start_session(self):
         """Start a new chat session"""
@@ -16,33 +82,83 @@ class BankingBotClient:
         
     async def end_session(self):
         """End the current chat session"""
-        if self.session_id:
-            async with aiohttp.ClientSession() as session:
-                async with session.delete(f"{self.server_url}/chat/{self.session_id}") as response:
+        try:
+            if self.session_id:
+                async with self.http.delete(f"{self.server_url}/chat/{self.session_id}") as response:
                     if response.status == 200:
                         self.session_id = None
                         return True
-        return False
+            return False
+        finally:
+            await self.aclose()
 
-    async def send_message(self, message: str) -> str:
-        """Send a message to the bot and get the response"""
+    async def stream_message(self, message: str) -> AsyncIterator[str]:
+        """Send a message to the bot and yield the response as it streams in"""
         if not self.session_id:
             raise ValueError("No active session")
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
+        async with self.http.post(
+            f"{self.server_url}/chat/{self.session_id}",
+            json={"message": message}
+        ) as response:
+            if response.status != 200:
+                yield f"Error: {response.status}"
+                return
+
+            # Server-sent events: one "data: ..." line per event, ending with [DONE]
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[len(b"data: "):]
+                if data == b"[DONE]":
+                    break
+                event = json.loads(data)
+                if "error" in event:
+                    yield f"Error: {event['error']}"
+                else:
+                    yield event["delta"]
+
+    def predict_next_message(self, last_response: Optional[str]) -> Optional[str]:
+        """Guess the user's next message from the assistant's last reply"""
+        if last_response is None:
+            return _OPENING_PREDICTION
+        if _BALANCE_MARKER in last_response:
+            return _CLOSING_PREDICTION
+        return None
+
+    async def prefetch(self, message: str) -> bool:
+        """Ask the server to prepare a reply to a predicted message"""
+        if not self.session_id:
+            return False
+        try:
+            async with self.http.post(
                 f"{self.server_url}/chat/{self.session_id}",
-                json={"message": message}
+                json={"message": message},
+                headers={"X-Speculative": "1"}
             ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result["response"]
-                else:
-                    return f"Error: {response.status}"
+                if response.status != 200:
+                    return False
+                result = await response.json()
+                return result["prefetched"]
+        except aiohttp.ClientError:
+            return False
+
+    def start_prefetch(self, last_response: Optional[str]) -> Optional[asyncio.Task]:
+        """Prefetch the predicted next turn in the background while the user types"""
+        prediction = self.predict_next_message(last_response)
+        if prediction is None:
+            return None
+        return asyncio.create_task(self.prefetch(prediction))
+
+    async def send_message(self, message: str) -> str:
+        """Send a message to the bot and get the full response"""
+        return "".join([delta async for delta in self.stream_message(message)])
 
     def clear_screen(self):
         """Clear the terminal screen"""
-        os.system('cls' if os.name == 'nt' else 'clear')
+        sys.stdout.write(_CLEAR_SCREEN)
+        sys.stdout.flush()
 
     async def run_interactive(self):
         """Run the interactive chat session"""
@@ -53,28 +169,44 @@ class BankingBotClient:
         print("Type 'quit' to exit\n")
         print("Assistant: How can I help you today?")
 
-        while True:
-            try:
-                # Get user input
-                user_input = input("\nYou: ").strip()
+        prefetch_task = self.start_prefetch(None)
+        try:
+            while True:
+                try:
+                    # Get user input
+                    user_input = (await read_input("\nYou: ")).strip()
+
+                    # Don't let a prefetch that hasn't reached the server race the real message;
+                    # one the server already started still completes and can be claimed
+                    if prefetch_task is not None and not prefetch_task.done():
+                        prefetch_task.cancel()
                 
-                # Check for quit command
-                if user_input.lower() == 'quit':
-                    print("\nAssistant: Thank you for using our banking service. Goodbye!")
+                    # Check for quit command
+                    if user_input.lower() == 'quit':
+                        print("\nAssistant: Thank you for using our banking service. Goodbye!")
+                        await self.end_session()
+                        break
+
+                    # Send message and print the response as it streams
+                    print("\nAssistant: ", end="", flush=True)
+                    response_parts = []
+                    async for delta in self.stream_message(user_input):
+                        response_parts.append(delta)
+                        print(delta, end="", flush=True)
+                    print()
+
+                    prefetch_task = self.start_prefetch("".join(response_parts))
+
+                except (KeyboardInterrupt, asyncio.CancelledError):
+                    # Ctrl+C while awaiting input cancels this task instead of raising here
+                    print("\n\nExiting gracefully...")
                     await self.end_session()
                     break
-
-                # Send message and get response
-                response = await self.send_message(user_input)
-                print(f"\nAssistant: {response}")
-
-            except KeyboardInterrupt:
-                print("\n\nExiting gracefully...")
-                await self.end_session()
-                break
-            except Exception as e:
-                print(f"\nError: {str(e)}")
-                print("Please try again.")
+                except Exception as e:
+                    print(f"\nError: {str(e)}")
+                    print("Please try again.")
+        finally:
+            await self.aclose()
 
 async def main():
     client = BankingBotClient()
@@ -1,49 +1,98 @@
-import json
+import hashlib
+import hmac
+import mmap
+import os
+import secrets
+import orjson
+from types import MappingProxyType
 from typing import Dict, Any
 from pathlib import Path
 
+# Key for hashing PINs; set PIN_HASH_KEY to keep hashes stable across restarts
+_PIN_HASH_KEY = (
+    hashlib.blake2b(os.environ["PIN_HASH_KEY"].encode()).digest()
+    if "PIN_HASH_KEY" in os.environ
+    else secrets.token_bytes(32)
+)
+
+def hash_pin(pin: str) -> bytes:
+    """Keyed BLAKE2b digest of a PIN"""
+    return hashlib.blake2b(str(pin).encode(), key=_PIN_HASH_KEY, digest_size=16).digest()
+
+# Shared read-only result for missing keys, so failed lookups don't allocate
+_EMPTY = MappingProxyType({})
+
+# Files above this size are parsed straight from a memory map instead of read into a copy
+_MMAP_THRESHOLD = 50 * 1024 * 1024
+
 class MockDataLoader:
     def __init__(self, mock_data_path: str = "mock_accounts.json"):
         self.mock_data_path = Path(mock_data_path)
         self.data: Dict[str, Any] = {}
+        self._accounts: Dict[str, Dict[str, Any]] = {}
+        self._account_types: Dict[str, Dict[str, Any]] = {}
+        self._currencies: Dict[str, Dict[str, Any]] = {}
+        self._formatted_balances: Dict[str, str] = {}
         self.load_data()
     
     def load_data(self) -> None:
         """Load mock data from JSON file"""
         try:
-            with open(self.mock_data_path, 'r') as f:
-                self.data = json.load(f)
+            with open(self.mock_data_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size > _MMAP_THRESHOLD:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        with memoryview(mapped) as view:
+                            self.data = orjson.loads(view)
+                else:
+                    self.data = orjson.loads(f.read())
         except FileNotFoundError:
             print(f"Mock data file not found at {self.mock_data_path}")
             self.data = {"accounts": {}, "account_types": {}, "currencies": {}}
+
+        # Bind each section once so lookups are a single dict access
+        self._accounts = self.data.get("accounts", {})
+        self._account_types = self.data.get("account_types", {})
+        self._currencies = self.data.get("currencies", {})
+
+        # Keep only keyed hashes of PINs in memory
+        for account in self._accounts.values():
+            if "pin" in account:
+                account["pin"] = hash_pin(account["pin"])
+
+        # Mock data is read-only at runtime, so format every balance once up front
+        self._formatted_balances = {
+            account_number: self._format_balance(account)
+            for account_number, account in self._accounts.items()
+        }
     
     def get_account(self, account_number: str) -> Dict[str, Any]:
         """Get account details by account number"""
-        return self.data.get("accounts", {}).get(account_number, {})
+        return self._accounts.get(account_number, _EMPTY)
     
     def get_account_type_details(self, account_type: str) -> Dict[str, Any]:
         """Get account type details"""
-        return self.data.get("account_types", {}).get(account_type, {})
+        return self._account_types.get(account_type, _EMPTY)
     
     def get_currency_details(self, currency_code: str) -> Dict[str, Any]:
         """Get currency details"""
-        return self.data.get("currencies", {}).get(currency_code, {})
+        return self._currencies.get(currency_code, _EMPTY)
     
     def validate_account_and_pin(self, account_number: str, pin: str) -> bool:
         """Validate account number and PIN combination"""
         account = self.get_account(account_number)
-        return account.get("pin") == pin
+        # Constant-time comparison so response timing doesn't leak PIN digits
+        return hmac.compare_digest(account.get("pin", b""), hash_pin(pin))
 
-    def get_formatted_balance(self, account_number: str) -> str:
-        """Get formatted balance with currency symbol"""
-        account = self.get_account(account_number)
-        if not account:
-            return "Account not found"
-        
+    def _format_balance(self, account: Dict[str, Any]) -> str:
+        """Format an account's balance with its currency symbol"""
         currency = self.get_currency_details(account.get("currency", "USD"))
         symbol = currency.get("symbol", "$")
         return f"{symbol}{account.get('balance', 0):,.2f}"
 
+    def get_formatted_balance(self, account_number: str) -> str:
+        """Get formatted balance with currency symbol"""
+        return self._formatted_balances.get(account_number, "Account not found")
+
     def get_account_status(self, account_number: str) -> str:
         """Get account status"""
         account = self.get_account(account_number)
@@ -52,7 +101,7 @@ class MockDataLoader:
     @property
     def mock_accounts(self) -> Dict[str, Dict[str, Any]]:
         """Get all accounts data for compatibility with existing code"""
-        return self.data.get("accounts", {})
+        return self._accounts
 
 # Example usage in AsyncBankingChatbot:
 """
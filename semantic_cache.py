@@ -0,0 +1,51 @@
+from typing import List, Optional
+import numpy as np
+from openai import AsyncOpenAI
+
+class SemanticCache:
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        model: str = "text-embedding-3-small",
+        threshold: float = 0.90,
+        maxsize: int = 1024
+    ):
+        self.client = client
+        self.model = model
+        self.threshold = threshold
+        self.maxsize = maxsize
+
+        # Unit-normalized embeddings (one row per entry) and their responses
+        self._embeddings: Optional[np.ndarray] = None
+        self._responses: List[str] = []
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed text as a unit vector so a dot product is cosine similarity"""
+        response = await self.client.embeddings.create(model=self.model, input=text)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def lookup(self, embedding: np.ndarray) -> Optional[str]:
+        """Return the closest cached response if it clears the threshold"""
+        if self._embeddings is None:
+            return None
+
+        scores = self._embeddings @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self._responses[best]
+
+    def store(self, embedding: np.ndarray, response: str) -> None:
+        """Cache a response, evicting the oldest entry once the cache is full"""
+        if self._embeddings is None:
+            self._embeddings = embedding[np.newaxis, :]
+            self._responses = [response]
+            return
+
+        matrix = self._embeddings
+        if len(self._responses) >= self.maxsize:
+            matrix = matrix[1:]
+            self._responses.pop(0)
+        self._embeddings = np.vstack([matrix, embedding])
+        self._responses.append(response)
@@ -0,0 +1,261 @@
+import asyncio
+import contextlib
+import orjson
+from typing import Dict, Any, AsyncIterator, List, Optional
+from cachetools import TTLCache
+
+class SessionStore:
+    def __init__(self, maxsize: int = 10_000, ttl: float = 1800, batch_ttl: float = 2 * 86400):
+        # Each session is {"messages": [...], "state": {...}}; idle sessions expire after ttl seconds
+        self._sessions: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._locks: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Submitted Batch API jobs are {"items": [...], "results": {...}}; the Batch API may take 24 hours
+        self._batches: TTLCache = TTLCache(maxsize=1_000, ttl=batch_ttl)
+        # Cumulative token counts by model; with this store they only cover the current process
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def _touch(self, session_id: str) -> Dict[str, Any]:
+        """Get or create a session and refresh its expiry"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"messages": [], "state": {}}
+        self._sessions[session_id] = session
+        return session
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """Get the lock that serializes turns within a session"""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[session_id] = lock
+        return lock
+
+    async def is_locked(self, session_id: str) -> bool:
+        """Check whether a turn is currently running for the session"""
+        lock = self._locks.get(session_id)
+        return lock is not None and lock.locked()
+
+    async def get_messages(self, session_id: str, start: int = 0) -> List[Dict[str, Any]]:
+        """Get the session's messages from index start onwards"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return []
+        return session["messages"][start:]
+
+    async def count_messages(self, session_id: str) -> int:
+        """Get the number of stored messages"""
+        session = self._sessions.get(session_id)
+        return len(session["messages"]) if session else 0
+
+    async def append_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Append messages to the session history"""
+        self._touch(session_id)["messages"].extend(messages)
+
+    async def get_state(self, session_id: str) -> Dict[str, Any]:
+        """Get the session's bookkeeping fields (flow state, summary, ...)"""
+        session = self._sessions.get(session_id)
+        return dict(session["state"]) if session else {}
+
+    async def update_state(self, session_id: str, **fields: Any) -> None:
+        """Update the session's bookkeeping fields"""
+        self._touch(session_id)["state"].update(fields)
+
+    async def delete(self, session_id: str) -> None:
+        """Drop a session and everything stored for it"""
+        self._sessions.pop(session_id, None)
+        self._locks.pop(session_id, None)
+
+    async def put_batch(self, batch_id: str, items: List[Dict[str, Any]]) -> None:
+        """Store the turns submitted in a batch"""
+        self._batches[batch_id] = {"items": items, "results": {}}
+
+    async def get_batch(self, batch_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Get the turns submitted in a batch, or None if it's unknown or expired"""
+        batch = self._batches.get(batch_id)
+        return batch["items"] if batch else None
+
+    async def get_batch_results(self, batch_id: str) -> Dict[str, Any]:
+        """Get the results recorded so far for a batch, by custom ID"""
+        batch = self._batches.get(batch_id)
+        return dict(batch["results"]) if batch else {}
+
+    async def put_batch_result(self, batch_id: str, custom_id: str, result: Dict[str, Any]) -> None:
+        """Record the result of one turn in a batch"""
+        batch = self._batches.get(batch_id)
+        if batch is not None:
+            batch["results"][custom_id] = result
+
+    async def add_usage(self, model: str, counts: Dict[str, int]) -> None:
+        """Add token counts to a model's running totals"""
+        totals = self._usage.setdefault(model, dict.fromkeys(counts, 0))
+        for field, count in counts.items():
+            totals[field] = totals.get(field, 0) + count
+
+    async def get_usage(self) -> Dict[str, Dict[str, int]]:
+        """Get the running token totals by model"""
+        return {model: dict(totals) for model, totals in self._usage.items()}
+
+    async def close(self) -> None:
+        """Release resources held by the store"""
+
+class RedisSessionStore:
+    def __init__(
+        self,
+        url: str,
+        ttl: int = 1800,
+        lock_timeout: int = 30,
+        lock_wait: int = 600,
+        batch_ttl: int = 2 * 86400
+    ):
+        # Imported here so the in-process store works without redis installed
+        import redis.asyncio as redis
+
+        # Shared across workers: history is a list of message blobs under chat:{session_id},
+        # state is a hash under chat:{session_id}:state; both expire after ttl seconds idle.
+        # Batches are a blob under batch:{batch_id} and a results hash, kept for batch_ttl seconds.
+        # Token totals are a hash per model under metrics:tokens:{model}, summed over all workers.
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.batch_ttl = batch_ttl
+        # The lock is renewed while held, so lock_timeout only bounds how long a crashed worker
+        # blocks its session; lock_wait bounds how long a turn queues behind another one
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+
+    def _messages_key(self, session_id: str) -> str:
+        return f"chat:{session_id}"
+
+    def _state_key(self, session_id: str) -> str:
+        return f"chat:{session_id}:state"
+
+    def _lock_key(self, session_id: str) -> str:
+        return f"chat:{session_id}:lock"
+
+    def _batch_key(self, batch_id: str) -> str:
+        return f"batch:{batch_id}"
+
+    def _batch_results_key(self, batch_id: str) -> str:
+        return f"batch:{batch_id}:results"
+
+    def _usage_key(self, model: str) -> str:
+        return f"metrics:tokens:{model}"
+
+    @contextlib.asynccontextmanager
+    async def lock(self, session_id: str) -> AsyncIterator[None]:
+        """Hold the lock that serializes turns within a session, across all workers"""
+        lock = self._redis.lock(
+            self._lock_key(session_id),
+            timeout=self.lock_timeout,
+            blocking_timeout=self.lock_wait
+        )
+        async with lock:
+            # A turn can outlast lock_timeout (two completions, each retrying on rate limits),
+            # so keep resetting the expiry until it finishes
+            turn = asyncio.current_task()
+            renewal = asyncio.create_task(self._renew_lock(lock, turn))
+            try:
+                yield
+            except asyncio.CancelledError:
+                # Cancelled because the lock was lost: surface why instead of a bare cancellation
+                if renewal.done() and not renewal.cancelled() and renewal.exception() is not None:
+                    turn.uncancel()
+                    raise renewal.exception()
+                raise
+            finally:
+                renewal.cancel()
+                await asyncio.wait([renewal])
+
+    async def _renew_lock(self, lock: Any, turn: asyncio.Task) -> None:
+        """Reset a held lock's expiry every third of lock_timeout, cancelling the turn if that fails"""
+        try:
+            while True:
+                await asyncio.sleep(self.lock_timeout / 3)
+                await lock.reacquire()
+        except Exception:
+            # Another worker may own the session by now, so the turn must not go on to commit
+            turn.cancel()
+            raise
+
+    async def is_locked(self, session_id: str) -> bool:
+        """Check whether a turn is currently running for the session"""
+        return bool(await self._redis.exists(self._lock_key(session_id)))
+
+    async def get_messages(self, session_id: str, start: int = 0) -> List[Dict[str, Any]]:
+        """Get the session's messages from index start onwards"""
+        blobs = await self._redis.lrange(self._messages_key(session_id), start, -1)
+        return [orjson.loads(blob) for blob in blobs]
+
+    async def count_messages(self, session_id: str) -> int:
+        """Get the number of stored messages"""
+        return await self._redis.llen(self._messages_key(session_id))
+
+    async def append_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Append messages to the session history"""
+        if not messages:
+            return
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self._messages_key(session_id), *(orjson.dumps(message) for message in messages))
+            pipe.expire(self._messages_key(session_id), self.ttl)
+            pipe.expire(self._state_key(session_id), self.ttl)
+            await pipe.execute()
+
+    async def get_state(self, session_id: str) -> Dict[str, Any]:
+        """Get the session's bookkeeping fields (flow state, summary, ...)"""
+        fields = await self._redis.hgetall(self._state_key(session_id))
+        return {key.decode(): orjson.loads(value) for key, value in fields.items()}
+
+    async def update_state(self, session_id: str, **fields: Any) -> None:
+        """Update the session's bookkeeping fields"""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                self._state_key(session_id),
+                mapping={key: orjson.dumps(value) for key, value in fields.items()}
+            )
+            pipe.expire(self._state_key(session_id), self.ttl)
+            pipe.expire(self._messages_key(session_id), self.ttl)
+            await pipe.execute()
+
+    async def delete(self, session_id: str) -> None:
+        """Drop a session and everything stored for it"""
+        await self._redis.delete(self._messages_key(session_id), self._state_key(session_id))
+
+    async def put_batch(self, batch_id: str, items: List[Dict[str, Any]]) -> None:
+        """Store the turns submitted in a batch"""
+        await self._redis.set(self._batch_key(batch_id), orjson.dumps(items), ex=self.batch_ttl)
+
+    async def get_batch(self, batch_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Get the turns submitted in a batch, or None if it's unknown or expired"""
+        blob = await self._redis.get(self._batch_key(batch_id))
+        return orjson.loads(blob) if blob is not None else None
+
+    async def get_batch_results(self, batch_id: str) -> Dict[str, Any]:
+        """Get the results recorded so far for a batch, by custom ID"""
+        fields = await self._redis.hgetall(self._batch_results_key(batch_id))
+        return {key.decode(): orjson.loads(value) for key, value in fields.items()}
+
+    async def put_batch_result(self, batch_id: str, custom_id: str, result: Dict[str, Any]) -> None:
+        """Record the result of one turn in a batch"""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._batch_results_key(batch_id), custom_id, orjson.dumps(result))
+            pipe.expire(self._batch_results_key(batch_id), self.batch_ttl)
+            await pipe.execute()
+
+    async def add_usage(self, model: str, counts: Dict[str, int]) -> None:
+        """Add token counts to a model's running totals"""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for field, count in counts.items():
+                pipe.hincrby(self._usage_key(model), field, count)
+            await pipe.execute()
+
+    async def get_usage(self) -> Dict[str, Dict[str, int]]:
+        """Get the running token totals by model"""
+        prefix = self._usage_key("")
+        usage = {}
+        async for key in self._redis.scan_iter(match=f"{prefix}*"):
+            fields = await self._redis.hgetall(key)
+            usage[key.decode()[len(prefix):]] = {field.decode(): int(value) for field, value in fields.items()}
+        return usage
+
+    async def close(self) -> None:
+        """Release resources held by the store"""
+        await self._redis.aclose()